@@ -1,4 +1,7 @@
+import asyncio
 import os
+from typing import Iterator, List, Sequence
+
 import streamlit as st
 import google.generativeai as genai
 
@@ -7,6 +10,7 @@ from src.ui import (
     render_sidebar, 
     render_chat_interface, 
     display_chat_history,
+    display_processed_sources,
     display_sources
 )
 from src.services import (
@@ -14,14 +18,158 @@ from src.services import (
     process_pdf, 
     process_web, 
     create_vector_store,
-    get_indexed_documents
+    upload_documents,
+    get_indexed_documents,
+    get_vector_store,
+    get_cached_response,
+    cache_response,
+    retrieve,
+    truncate_to_token_budget
 )
+from src.config import COLLECTION_NAME
+from src.models import GeminiEmbedder
 from src.agents import (
     get_query_rewriter_agent, 
     get_web_search_agent, 
     get_rag_agent
 )
 
+async def rewrite_query(prompt: str) -> str:
+    """Rewrite the prompt for retrieval, falling back to the original on failure."""
+    try:
+        query_rewriter = get_query_rewriter_agent()
+        return (await query_rewriter.arun(prompt)).content
+    except Exception as e:
+        st.warning(f"⚠️ Query rewriting failed: {e}")
+        return prompt
+
+def fetch_documents(qdrant_client, embedder: GeminiEmbedder, query: str, threshold: float) -> List:
+    """Embed the query once (cached) and search Qdrant directly.
+
+    Runs in a worker thread without Streamlit's script context, so errors
+    are raised for the caller to report rather than written to the page.
+    """
+    query_embedding = embedder.embed_query_or_raise(query)
+    return retrieve(qdrant_client, query_embedding, k=5, threshold=threshold)
+
+async def search_documents(qdrant_client, query: str, threshold: float) -> List:
+    """Search documents off the event loop, or nothing when no client is given."""
+    if qdrant_client is None:
+        return []
+    # Built here so the embedder reads the API key from this session's state
+    embedder = GeminiEmbedder()
+    try:
+        return await asyncio.to_thread(fetch_documents, qdrant_client, embedder, query, threshold)
+    except Exception as e:
+        st.warning(f"⚠️ Document search failed: {e}")
+        return []
+
+def stream_content(response_stream) -> Iterator[str]:
+    """Yield the text of each streamed agent response chunk."""
+    for chunk in response_stream:
+        content = getattr(chunk, "content", None)
+        if isinstance(content, str) and content:
+            yield content
+
+async def handle_prompt(prompt: str, search_domains: Sequence[str], qdrant_client):
+    """Answer a chat prompt, overlapping independent API calls where possible."""
+    st.session_state.history.append({"role": "user", "content": prompt})
+    with st.chat_message("user"):
+        st.write(prompt)
+
+    # 0. Semantic Cache
+    cached = None
+    prompt_embedding = None
+    web_search_enabled = bool(st.session_state.use_web_search and st.session_state.exa_api_key)
+    # Forced web search always wants fresh results
+    if st.session_state.enable_semantic_cache and qdrant_client and not st.session_state.force_web_search:
+        prompt_embedding = GeminiEmbedder().embed_query(prompt)
+        if prompt_embedding:
+            cached = get_cached_response(qdrant_client, prompt_embedding, web_search_enabled)
+
+    if cached:
+        answer, docs = cached
+        st.session_state.history.append({"role": "assistant", "content": answer})
+        with st.chat_message("assistant"):
+            st.write(answer)
+            st.caption("⚡ Served from semantic cache")
+            if docs:
+                display_sources(docs)
+        return
+
+    search_client = None
+    if not st.session_state.force_web_search and st.session_state.vector_store:
+        search_client = qdrant_client
+    threshold = st.session_state.similarity_threshold
+
+    # 1. Rewriting Query (with an optimistic retrieval on the original prompt)
+    with st.spinner("🤔 Reformulating query..."):
+        rewritten_query, docs = await asyncio.gather(
+            rewrite_query(prompt),
+            search_documents(search_client, prompt, threshold)
+        )
+    if rewritten_query != prompt:
+        with st.expander("🔄 See rewritten query"):
+            st.write(f"Original: {prompt}")
+            st.write(f"Rewritten: {rewritten_query}")
+
+    # 2. Search Strategy
+    context = ""
+    if search_client is not None:
+        if not docs and rewritten_query != prompt:
+            docs = await search_documents(search_client, rewritten_query, threshold)
+        if docs:
+            context = "\n\n".join(d.page_content for d in docs)
+            st.info(f"📊 Found {len(docs)} relevant documents")
+        elif st.session_state.use_web_search:
+            st.info("🔄 No documents found, checking web...")
+
+    # 3. Web Search
+    if (st.session_state.force_web_search or not context) and st.session_state.use_web_search and st.session_state.exa_api_key:
+        with st.spinner("🔍 Searching the web..."):
+            try:
+                web_search_agent = get_web_search_agent(search_domains)
+                web_results = (await web_search_agent.arun(rewritten_query)).content
+                if web_results:
+                    context = f"Web Search Results:\n{web_results}"
+                    st.info("ℹ️ Using web search results")
+            except Exception as e:
+                st.warning(f"⚠️ Web search failed: {e}")
+
+    # 4. Generate Response
+    with st.spinner("🤖 Thinking..."):
+        try:
+            if context:
+                # Keep the prompt within the token budget instead of failing at Gemini's cap
+                context = truncate_to_token_budget(context)
+            rag_agent = get_rag_agent()
+            full_prompt = f"Context: {context}\n\nQuestion: {prompt}\nRewritten: {rewritten_query}" if context else f"Question: {prompt}"
+            
+            with st.chat_message("assistant"):
+                response_stream = rag_agent.run(full_prompt, stream=True)
+                answer = st.write_stream(stream_content(response_stream))
+                # write_stream returns [] when nothing was yielded
+                answer = answer if isinstance(answer, str) else ""
+                if not st.session_state.force_web_search and docs:
+                    display_sources(docs)
+            
+            st.session_state.history.append({
+                "role": "assistant",
+                "content": answer
+            })
+            if prompt_embedding and answer:
+                cache_response(qdrant_client, prompt_embedding, answer, docs, web_search_enabled)
+                    
+        except Exception as e:
+            st.error(f"❌ Error: {str(e)}")
+
+def store_texts(qdrant_client, texts: List) -> bool:
+    """Add chunks to the existing collection, creating it on first upload."""
+    if st.session_state.vector_store:
+        return upload_documents(qdrant_client, texts)
+    st.session_state.vector_store = create_vector_store(qdrant_client, texts)
+    return st.session_state.vector_store is not None
+
 def main():
     st.title("🤔 Agentic RAG with Gemini Thinking and Agno")
     
@@ -53,11 +201,7 @@ def main():
         st.sidebar.error("❌ Qdrant client not connected")
     
     # Display Processed Sources (always show if we have documents)
-    if st.session_state.processed_documents:
-        st.sidebar.header("📚 Processed Sources")
-        for source in st.session_state.processed_documents:
-            icon = "📄" if source.endswith('.pdf') else "🌐"
-            st.sidebar.text(f"{icon} {source}")
+    display_processed_sources()
 
 
     
@@ -69,14 +213,7 @@ def main():
         # Initialize vector store if not already done
         if qdrant_client and st.session_state.vector_store is None and st.session_state.processed_documents:
             try:
-                from src.config import COLLECTION_NAME
-                from src.models import GeminiEmbedder
-                from langchain_qdrant import QdrantVectorStore
-                st.session_state.vector_store = QdrantVectorStore(
-                    client=qdrant_client,
-                    collection_name=COLLECTION_NAME,
-                    embedding=GeminiEmbedder()
-                )
+                st.session_state.vector_store = get_vector_store(qdrant_client, COLLECTION_NAME)
             except Exception as e:
                 st.warning(f"⚠️ Could not initialize vector store: {e}")
         
@@ -85,101 +222,34 @@ def main():
 
         st.sidebar.header("📁 Data Upload")
         uploaded_file = st.sidebar.file_uploader("Upload PDF", type=["pdf"])
-        web_url = st.sidebar.text_input("Or enter URL")
+        web_urls = st.sidebar.text_area("Or enter URLs (one per line)")
         
         # Process Uploads
         if uploaded_file and uploaded_file.name not in st.session_state.processed_documents:
             with st.spinner('Processing PDF...'):
                 texts = process_pdf(uploaded_file)
-                if texts and qdrant_client:
-                    if st.session_state.vector_store:
-                        st.session_state.vector_store.add_documents(texts)
-                    else:
-                        st.session_state.vector_store = create_vector_store(qdrant_client, texts)
+                if texts and qdrant_client and store_texts(qdrant_client, texts):
                     st.session_state.processed_documents.append(uploaded_file.name)
                     st.success(f"✅ Added PDF: {uploaded_file.name}")
 
-        if web_url and web_url not in st.session_state.processed_documents:
-            with st.spinner('Processing URL...'):
-                texts = process_web(web_url)
-                if texts and qdrant_client:
-                    if st.session_state.vector_store:
-                        st.session_state.vector_store.add_documents(texts)
-                    else:
-                        st.session_state.vector_store = create_vector_store(qdrant_client, texts)
-                    st.session_state.processed_documents.append(web_url)
-                    st.success(f"✅ Added URL: {web_url}")
+        new_urls = [
+            url for url in dict.fromkeys(u.strip() for u in web_urls.splitlines())
+            if url and url not in st.session_state.processed_documents
+        ]
+        if new_urls:
+            with st.spinner(f'Processing {len(new_urls)} URL(s)...'):
+                texts = process_web(new_urls)
+                if texts and qdrant_client and store_texts(qdrant_client, texts):
+                    st.session_state.processed_documents.extend(new_urls)
+                    for url in new_urls:
+                        st.success(f"✅ Added URL: {url}")
 
         # Chat Area
+        display_chat_history()
         prompt = render_chat_interface()
         
         if prompt:
-            st.session_state.history.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.write(prompt)
-
-            # 1. Rewriting Query
-            rewritten_query = prompt
-            with st.spinner("🤔 Reformulating query..."):
-                try:
-                    query_rewriter = get_query_rewriter_agent()
-                    rewritten_query = query_rewriter.run(prompt).content
-                    with st.expander("🔄 See rewritten query"):
-                        st.write(f"Original: {prompt}")
-                        st.write(f"Rewritten: {rewritten_query}")
-                except Exception as e:
-                    st.warning(f"⚠️ Query rewriting failed: {e}")
-
-            # 2. Search Strategy
-            context = ""
-            docs = []
-            if not st.session_state.force_web_search and st.session_state.vector_store:
-                retriever = st.session_state.vector_store.as_retriever(
-                    search_type="similarity_score_threshold",
-                    search_kwargs={
-                        "k": 5, 
-                        "score_threshold": st.session_state.similarity_threshold
-                    }
-                )
-                docs = retriever.invoke(rewritten_query)
-                if docs:
-                    context = "\n\n".join([d.page_content for d in docs])
-                    st.info(f"📊 Found {len(docs)} relevant documents")
-                elif st.session_state.use_web_search:
-                    st.info("🔄 No documents found, checking web...")
-
-            # 3. Web Search
-            if (st.session_state.force_web_search or not context) and st.session_state.use_web_search and st.session_state.exa_api_key:
-                with st.spinner("🔍 Searching the web..."):
-                    try:
-                        web_search_agent = get_web_search_agent(search_domains)
-                        web_results = web_search_agent.run(rewritten_query).content
-                        if web_results:
-                            context = f"Web Search Results:\n{web_results}"
-                            st.info("ℹ️ Using web search results")
-                    except Exception as e:
-                        st.warning(f"⚠️ Web search failed: {e}")
-
-            # 4. Generate Response
-            with st.spinner("🤖 Thinking..."):
-                try:
-                    rag_agent = get_rag_agent()
-                    full_prompt = f"Context: {context}\n\nQuestion: {prompt}\nRewritten: {rewritten_query}" if context else f"Question: {prompt}"
-                    
-                    response = rag_agent.run(full_prompt)
-                    
-                    st.session_state.history.append({
-                        "role": "assistant",
-                        "content": response.content
-                    })
-                    
-                    with st.chat_message("assistant"):
-                        st.write(response.content)
-                        if not st.session_state.force_web_search and docs:
-                            display_sources(docs)
-                            
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
+            asyncio.run(handle_prompt(prompt, search_domains, qdrant_client))
 
     else:
         st.warning("⚠️ Please enter your Google API Key to continue")
@@ -1,3 +1,5 @@
+from typing import Sequence
+
 import streamlit as st
 from agno.agent import Agent
 from agno.models.google import Gemini
@@ -27,14 +29,14 @@ def get_query_rewriter_agent() -> Agent:
         markdown=True,
     )
 
-def get_web_search_agent(search_domains: list) -> Agent:
+def get_web_search_agent(search_domains: Sequence[str]) -> Agent:
     """Initialize a web search agent."""
     return Agent(
         name="Web Search Agent",
         model=Gemini(id=DEFAULT_MODEL_ID),
         tools=[ExaTools(
             api_key=st.session_state.exa_api_key,
-            include_domains=search_domains,
+            include_domains=list(search_domains),
             num_results=5
         )],
         instructions="""You are a web search expert. Your task is to:
@@ -1,9 +1,31 @@
+import os
+
 # Configuration Constants
 COLLECTION_NAME = "gemini-thinking-agent-agno"
+RESPONSE_CACHE_COLLECTION = "rag-response-cache"
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Min cosine similarity to reuse a cached answer
 DEFAULT_MODEL_ID = "gemini-3-flash-preview"  # Use stable model ID if needed
 EMBEDDING_MODEL_ID = "models/text-embedding-004"
 VECTOR_SIZE = 768
+HNSW_EF = 64  # HNSW beam width per query; higher is more accurate but slower
+QUANTIZATION_MODE = "scalar"  # "scalar" (int8, 4x smaller), "binary" (32x smaller) or None
+EMBEDDING_BATCH_SIZE = 100  # Max contents per Gemini embed_content call
+EMBEDDING_MAX_WORKERS = 8  # Thread pool size when batch embedding is unavailable
+EMBEDDING_RPM_LIMIT = 1500  # Gemini embedding requests per minute
+EMBEDDING_TPM_LIMIT = 1_000_000  # Gemini embedding tokens per minute
+UPLOAD_PARALLEL = 4  # Qdrant upload_collection workers
+UPLOAD_BATCH_SIZE = 64  # Points per Qdrant upload request
+MAX_CONTEXT_TOKENS = 6000  # Context is trimmed from the tail beyond this budget
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+TEXT_SPLITTER = "recursive"  # "recursive" (characters) or "token" (tiktoken-based)
+TOKEN_CHUNK_SIZE = 256  # Chunk size in tokens when TEXT_SPLITTER == "token"
+TOKEN_CHUNK_OVERLAP = 50
 QDRANT_PATH = "./qdrant_data"
+EMBEDDING_CACHE_SIZE = 10_000  # In-memory embedding cache entries
+EMBEDDING_CACHE_TTL = 86400  # In-memory embedding cache TTL in seconds
+EMBEDDING_CACHE_DIR = os.path.join(QDRANT_PATH, "emb_cache")
+EMBEDDING_DISK_CACHE_TTL = 30 * 86400  # Disk embedding cache TTL in seconds
+EMBEDDING_DISK_CACHE_SIZE = 1 << 30  # Disk embedding cache size cap (1 GiB)
+WEB_REQUESTS_PER_SECOND = 4  # Throttle for concurrent URL fetches
 
@@ -0,0 +1,63 @@
+import atexit
+import hashlib
+import threading
+from typing import List, Optional
+
+import diskcache
+from cachetools import TTLCache
+
+from .config import (
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+    EMBEDDING_DISK_CACHE_SIZE,
+    EMBEDDING_DISK_CACHE_TTL,
+)
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache keyed by model, task type and SHA-256 of the text.
+    An in-memory TTL cache sits in front of a disk cache that survives restarts.
+    """
+    def __init__(self, maxsize: int, ttl: int, directory: str, disk_ttl: int, disk_size_limit: int):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()  # TTLCache is not thread-safe
+        self._disk = diskcache.Cache(directory, size_limit=disk_size_limit)
+        self._disk_ttl = disk_ttl
+
+    @staticmethod
+    def _key(model: str, task_type: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{task_type}:{digest}"
+
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        key = self._key(model, task_type, text)
+        with self._lock:
+            embedding = self._memory.get(key)
+        if embedding is None:
+            embedding = self._disk.get(key)
+            if embedding is not None:
+                with self._lock:
+                    self._memory[key] = embedding
+        return embedding
+
+    def set(self, model: str, task_type: str, text: str, embedding: List[float]) -> None:
+        key = self._key(model, task_type, text)
+        with self._lock:
+            self._memory[key] = embedding
+        self._disk.set(key, embedding, expire=self._disk_ttl)
+
+    def close(self) -> None:
+        self._disk.close()
+
+
+# Module-level singleton shared by every GeminiEmbedder instance
+embedding_cache = EmbeddingCache(
+    maxsize=EMBEDDING_CACHE_SIZE,
+    ttl=EMBEDDING_CACHE_TTL,
+    directory=EMBEDDING_CACHE_DIR,
+    disk_ttl=EMBEDDING_DISK_CACHE_TTL,
+    disk_size_limit=EMBEDDING_DISK_CACHE_SIZE
+)
+atexit.register(embedding_cache.close)
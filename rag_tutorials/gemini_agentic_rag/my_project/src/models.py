@@ -1,8 +1,31 @@
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
 import google.generativeai as genai
+from google.api_core.exceptions import GoogleAPICallError, InvalidArgument, NotFound, ResourceExhausted
 from langchain_core.embeddings import Embeddings
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from typing import List
 import streamlit as st
-from .config import EMBEDDING_MODEL_ID
+from .config import (
+    EMBEDDING_MODEL_ID,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_WORKERS,
+    EMBEDDING_RPM_LIMIT,
+    EMBEDDING_TPM_LIMIT,
+)
+from .embedding_cache import embedding_cache
+from .rate_limiter import RateLimiter
+
+# Shared across embedder instances so every caller draws from the same quota
+_rate_limiter = RateLimiter(rpm=EMBEDDING_RPM_LIMIT, tpm=EMBEDDING_TPM_LIMIT)
+
+def _is_batch_unsupported(error: GoogleAPICallError) -> bool:
+    """Whether the API rejected the batch method itself, rather than the key or the input.
+
+    A list ``content`` is sent as batchEmbedContents; models without it fail with
+    e.g. "models/... is not supported for batchEmbedContents", naming the method.
+    """
+    return "batchembedcontents" in str(error).lower()
 
 class GeminiEmbedder(Embeddings):
     """
@@ -15,17 +38,86 @@ class GeminiEmbedder(Embeddings):
         self.model = model_name
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self.embed_query(text) for text in texts]
+        """Embed texts, serving cached ones and batching only the misses."""
+        embeddings = [embedding_cache.get(self.model, "retrieval_document", text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+
+        fresh = self._embed_batched([texts[i] for i in missing])
+        if len(fresh) != len(missing):
+            # Embedding failed and the error was already reported
+            return []
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+            embedding_cache.set(self.model, "retrieval_document", texts[i], embedding)
+        return embeddings
 
     def embed_query(self, text: str) -> List[float]:
+        """Embed a search query with the query-side task type."""
         try:
-             response = genai.embed_content(
-                model=self.model,
-                content=text,
-                task_type="retrieval_document"
-            )
-             return response['embedding']
+             return self.embed_query_or_raise(text)
         except Exception as e:
             # Return empty list or handle error appropriately in production
             st.error(f"Embedding error: {e}")
             return []
+
+    def embed_query_or_raise(self, text: str) -> List[float]:
+        """Like embed_query, but raises instead of writing to the page (safe off the script thread)."""
+        embedding = embedding_cache.get(self.model, "retrieval_query", text)
+        if embedding is not None:
+            return embedding
+        embedding = self._embed_one(text, task_type="retrieval_query")
+        embedding_cache.set(self.model, "retrieval_query", text, embedding)
+        return embedding
+
+    def _embed_batched(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches, one API call per EMBEDDING_BATCH_SIZE texts."""
+        embeddings = []
+        try:
+            for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+                try:
+                    response = genai.embed_content(
+                        model=self.model,
+                        content=texts[start:start + EMBEDDING_BATCH_SIZE],
+                        task_type="retrieval_document"
+                    )
+                except (InvalidArgument, NotFound) as e:
+                    if not _is_batch_unsupported(e):
+                        raise
+                    # Model doesn't accept list content, embed the rest one by one
+                    embeddings.extend(self._embed_concurrently(texts[start:]))
+                    break
+                embeddings.extend(response['embedding'])
+            return embeddings
+        except Exception as e:
+            st.error(f"Embedding error: {e}")
+            return []
+
+    def _embed_concurrently(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with a bounded thread pool, preserving input order."""
+        # Not a with block: its exit waits on in-flight calls, which may be backing off
+        executor = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS)
+        futures = [executor.submit(self._embed_one, text, "retrieval_document") for text in texts]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        # One text failed if any are pending; drop the queued ones and don't wait for the rest
+        executor.shutdown(wait=False, cancel_futures=True)
+        if pending:
+            raise next(f.exception() for f in done if f.exception() is not None)
+        return [f.result() for f in futures]
+
+    @retry(
+        retry=retry_if_exception_type(ResourceExhausted),
+        wait=wait_exponential(multiplier=1, max=60),
+        stop=stop_after_attempt(5),
+        reraise=True
+    )
+    def _embed_one(self, text: str, task_type: str) -> List[float]:
+        # Rough token estimate (~4 chars per token) for TPM accounting
+        _rate_limiter.acquire(tokens=max(1, len(text) // 4))
+        response = genai.embed_content(
+            model=self.model,
+            content=text,
+            task_type=task_type
+        )
+        return response['embedding']
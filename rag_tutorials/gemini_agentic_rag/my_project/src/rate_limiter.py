@@ -0,0 +1,36 @@
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding-window limiter for requests and tokens per minute.
+    """
+    def __init__(self, rpm: int, tpm: int, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._lock = threading.Lock()
+        self._events = deque()  # (timestamp, tokens) per admitted request
+        self._tokens = 0
+
+    def acquire(self, tokens: int = 1) -> None:
+        """Block until a request costing `tokens` fits in the current window."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.window:
+                    _, expired = self._events.popleft()
+                    self._tokens -= expired
+
+                # An empty window always admits, so oversized requests can't deadlock
+                if not self._events or (
+                    len(self._events) < self.rpm and self._tokens + tokens <= self.tpm
+                ):
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+
+                wait = self.window - (now - self._events[0][0])
+            time.sleep(max(wait, 0.01))
@@ -1,18 +1,26 @@
-import tempfile
+import hashlib
+import uuid
+from functools import lru_cache
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+import fitz  # PyMuPDF
+import tiktoken
 import streamlit as st
 import bs4
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import WebBaseLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TextSplitter, TokenTextSplitter
+from langchain_core.documents import Document
 from langchain_qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client import models
+from qdrant_client.models import Distance, PointStruct, VectorParams
 
-from .config import COLLECTION_NAME, VECTOR_SIZE, CHUNK_SIZE, CHUNK_OVERLAP, QDRANT_PATH
+from .config import COLLECTION_NAME, RESPONSE_CACHE_COLLECTION, SEMANTIC_CACHE_THRESHOLD, VECTOR_SIZE, HNSW_EF, MAX_CONTEXT_TOKENS, QUANTIZATION_MODE, CHUNK_SIZE, CHUNK_OVERLAP, TEXT_SPLITTER, TOKEN_CHUNK_SIZE, TOKEN_CHUNK_OVERLAP, QDRANT_PATH, UPLOAD_PARALLEL, UPLOAD_BATCH_SIZE, WEB_REQUESTS_PER_SECOND
 from .models import GeminiEmbedder
 
+SOURCE_PAYLOAD_KEYS = ("metadata.file_name", "metadata.url")
+
 @st.cache_resource
 def get_local_qdrant_client() -> Optional[QdrantClient]:
     """Get or create a cached local Qdrant client."""
@@ -46,6 +54,80 @@ def init_qdrant() -> Optional[QdrantClient]:
             return None
         return get_cloud_qdrant_client(api_key, url)
 
+@st.cache_resource(hash_funcs={QdrantClient: id})
+def get_vector_store(client: QdrantClient, collection_name: str = COLLECTION_NAME) -> QdrantVectorStore:
+    """Get or create a cached LangChain vector store over a collection."""
+    return QdrantVectorStore(
+        client=client,
+        collection_name=collection_name,
+        embedding=GeminiEmbedder()
+    )
+
+def _facet_sources(client: QdrantClient) -> set:
+    """Collect distinct source names server-side from the keyword payload indexes."""
+    sources = set()
+    for key in SOURCE_PAYLOAD_KEYS:
+        facet = client.facet(
+            collection_name=COLLECTION_NAME,
+            key=key,
+            limit=1000
+        )
+        sources.update(hit.value for hit in facet.hits)
+    return sources
+
+def _scroll_sources(client: QdrantClient) -> Tuple[set, set]:
+    """Scroll through all points to get unique source names and seen payload keys."""
+    sources = set()
+    offset = None
+    all_keys = set()  # 用于调试
+    
+    while True:
+        points, next_offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=None,
+            limit=100,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False
+        )
+        
+        if not points:
+            break
+            
+        for point in points:
+            if point.payload:
+                # 收集所有键用于调试
+                all_keys.update(point.payload.keys())
+                
+                # 尝试多种可能的字段名
+                source_name = None
+                
+                # 方法1: 直接字段
+                if 'file_name' in point.payload:
+                    source_name = point.payload['file_name']
+                elif 'url' in point.payload:
+                    source_name = point.payload['url']
+                elif 'source' in point.payload:
+                    source_name = point.payload['source']
+                # 方法2: 嵌套在 metadata 中
+                elif 'metadata' in point.payload:
+                    metadata = point.payload['metadata']
+                    if isinstance(metadata, dict):
+                        source_name = (metadata.get('file_name') or 
+                                     metadata.get('url') or 
+                                     metadata.get('source'))
+                
+                if source_name:
+                    sources.add(source_name)
+        
+        # Check if there are more points
+        if next_offset is None:
+            break
+        offset = next_offset
+    
+    return sources, all_keys
+
+@st.cache_data(ttl=30, hash_funcs={QdrantClient: id})
 def get_indexed_documents(client: QdrantClient) -> List[str]:
     """Retrieve list of already indexed documents from Qdrant."""
     try:
@@ -61,54 +143,17 @@ def get_indexed_documents(client: QdrantClient) -> List[str]:
         if collection_info.points_count == 0:
             return []
         
-        # Scroll through all points to get unique source names
-        sources = set()
-        offset = None
+        # Fast path: facet over the payload indexes, O(distinct sources)
         all_keys = set()  # 用于调试
+        try:
+            sources = _facet_sources(client)
+        except Exception:
+            # Older Qdrant servers without the facet API
+            sources = set()
         
-        while True:
-            points, next_offset = client.scroll(
-                collection_name=COLLECTION_NAME,
-                scroll_filter=None,
-                limit=100,
-                offset=offset,
-                with_payload=True,
-                with_vectors=False
-            )
-            
-            if not points:
-                break
-                
-            for point in points:
-                if point.payload:
-                    # 收集所有键用于调试
-                    all_keys.update(point.payload.keys())
-                    
-                    # 尝试多种可能的字段名
-                    source_name = None
-                    
-                    # 方法1: 直接字段
-                    if 'file_name' in point.payload:
-                        source_name = point.payload['file_name']
-                    elif 'url' in point.payload:
-                        source_name = point.payload['url']
-                    elif 'source' in point.payload:
-                        source_name = point.payload['source']
-                    # 方法2: 嵌套在 metadata 中
-                    elif 'metadata' in point.payload:
-                        metadata = point.payload['metadata']
-                        if isinstance(metadata, dict):
-                            source_name = (metadata.get('file_name') or 
-                                         metadata.get('url') or 
-                                         metadata.get('source'))
-                    
-                    if source_name:
-                        sources.add(source_name)
-            
-            # Check if there are more points
-            if next_offset is None:
-                break
-            offset = next_offset
+        # Fallback: scroll for points stored before the indexes existed
+        if not sources:
+            sources, all_keys = _scroll_sources(client)
         
         # 调试信息
         if sources:
@@ -124,61 +169,168 @@ def get_indexed_documents(client: QdrantClient) -> List[str]:
         return []
 
 
+def ensure_payload_indexes(client: QdrantClient) -> None:
+    """Create keyword indexes on the source fields so they can be faceted."""
+    for key in SOURCE_PAYLOAD_KEYS:
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name=key,
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+
+def get_quantization_config() -> Optional[models.QuantizationConfig]:
+    """Build the collection quantization config for QUANTIZATION_MODE."""
+    if QUANTIZATION_MODE == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    if QUANTIZATION_MODE == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    return None
+
+def get_search_params(hnsw_ef: Optional[int] = None) -> Optional[models.SearchParams]:
+    """Search params with an optional HNSW ef that rescore quantized candidates."""
+    quantization = None
+    if QUANTIZATION_MODE:
+        quantization = models.QuantizationSearchParams(
+            rescore=True,
+            oversampling=2.0
+        )
+    if hnsw_ef is None and quantization is None:
+        return None
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        exact=False,
+        quantization=quantization
+    )
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter() -> TextSplitter:
+    """Build the configured text splitter once and reuse it for every upload."""
+    if TEXT_SPLITTER == "token":
+        return TokenTextSplitter(
+            chunk_size=TOKEN_CHUNK_SIZE,
+            chunk_overlap=TOKEN_CHUNK_OVERLAP
+        )
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+@lru_cache(maxsize=None)
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    # Gemini's tokenizer isn't available locally; cl100k_base is a close estimate.
+    # tiktoken downloads it on first use, so a failure is cached as None rather
+    # than raised, which lru_cache would not remember, retrying on every prompt
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def truncate_to_token_budget(text: str, max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+    """Trim text from the tail so it fits within max_tokens."""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Vocabulary unavailable offline; estimate ~4 chars per token
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+def deduplicate_chunks(chunks: List[Document]) -> List[Document]:
+    """Drop chunks whose text repeats an earlier one (headers, footers, nav blocks)."""
+    unique = {}
+    for chunk in chunks:
+        unique.setdefault(hashlib.sha1(chunk.page_content.encode("utf-8")).digest(), chunk)
+    return list(unique.values())
+
 def process_pdf(file) -> List:
     """Process PDF file and add source metadata."""
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            tmp_file.write(file.getvalue())
-            loader = PyPDFLoader(tmp_file.name)
-            documents = loader.load()
+        with fitz.open(stream=file.getvalue(), filetype="pdf") as pdf:
+            documents = [
+                Document(page_content=page.get_text(), metadata={"page": i})
+                for i, page in enumerate(pdf)
+            ]
+        
+        # Add source metadata (shared by every page of the upload)
+        base_meta = {
+            "source_type": "pdf",
+            "file_name": file.name,
+            "timestamp": datetime.now().isoformat()
+        }
+        for doc in documents:
+            doc.metadata |= base_meta
             
-            # Add source metadata
-            for doc in documents:
-                doc.metadata.update({
-                    "source_type": "pdf",
-                    "file_name": file.name,
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=CHUNK_SIZE,
-                chunk_overlap=CHUNK_OVERLAP
-            )
-            return text_splitter.split_documents(documents)
+        return deduplicate_chunks(get_text_splitter().split_documents(documents))
     except Exception as e:
         st.error(f"📄 PDF processing error: {str(e)}")
         return []
 
-def process_web(url: str) -> List:
-    """Process web URL and add source metadata."""
+def process_web(urls: List[str]) -> List:
+    """Fetch web URLs concurrently and add source metadata."""
     try:
         loader = WebBaseLoader(
-            web_paths=(url,),
+            web_paths=tuple(urls),
+            requests_per_second=WEB_REQUESTS_PER_SECOND,
             bs_kwargs=dict(
                 parse_only=bs4.SoupStrainer(
                     class_=("post-content", "post-title", "post-header", "content", "main")
                 )
             )
         )
-        documents = loader.load()
+        # aload fetches all pages concurrently, throttled by requests_per_second
+        documents = loader.aload()
         
-        # Add source metadata
+        # Add source metadata (shared by every document of the batch)
+        base_meta = {
+            "source_type": "url",
+            "timestamp": datetime.now().isoformat()
+        }
         for doc in documents:
-            doc.metadata.update({
-                "source_type": "url",
-                "url": url,
-                "timestamp": datetime.now().isoformat()
-            })
+            doc.metadata |= base_meta
+            doc.metadata["url"] = doc.metadata["source"]
             
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
-        )
-        return text_splitter.split_documents(documents)
+        return deduplicate_chunks(get_text_splitter().split_documents(documents))
     except Exception as e:
         st.error(f"🌐 Web processing error: {str(e)}")
         return []
 
+def upload_documents(client: QdrantClient, texts: List) -> bool:
+    """Embed chunks in batches and upload them with parallel Qdrant workers."""
+    try:
+        embeddings = GeminiEmbedder().embed_documents([t.page_content for t in texts])
+        if len(embeddings) != len(texts):
+            # Embedding failed and the error was already reported
+            return False
+        
+        # Payload layout matches QdrantVectorStore so LangChain can still read it
+        client.upload_collection(
+            collection_name=COLLECTION_NAME,
+            vectors=embeddings,
+            payload=[{"page_content": t.page_content, "metadata": t.metadata} for t in texts],
+            ids=[str(uuid.uuid4()) for _ in texts],
+            parallel=UPLOAD_PARALLEL,
+            batch_size=UPLOAD_BATCH_SIZE,
+            # Block until the points are searchable, as add_documents did
+            wait=True
+        )
+        get_indexed_documents.clear()
+        # Cached answers were generated without these chunks
+        clear_response_cache(client)
+        return True
+    except Exception as e:
+        st.error(f"🔴 Upload error: {str(e)}")
+        return False
+
 def create_vector_store(client: QdrantClient, texts: List) -> Optional[QdrantVectorStore]:
     """Create and initialize vector store with documents."""
     try:
@@ -189,23 +341,22 @@ def create_vector_store(client: QdrantClient, texts: List) -> Optional[QdrantVec
                 vectors_config=VectorParams(
                     size=VECTOR_SIZE,
                     distance=Distance.COSINE
-                )
+                ),
+                quantization_config=get_quantization_config()
             )
             st.success(f"📚 Created new collection: {COLLECTION_NAME}")
         except Exception as e:
             if "already exists" not in str(e).lower():
                 raise e
+        ensure_payload_indexes(client)
         
         # Initialize vector store
-        vector_store = QdrantVectorStore(
-            client=client,
-            collection_name=COLLECTION_NAME,
-            embedding=GeminiEmbedder()
-        )
+        vector_store = get_vector_store(client, COLLECTION_NAME)
         
         # Add documents
         with st.spinner('📤 Uploading documents to Qdrant...'):
-            vector_store.add_documents(texts)
+            if not upload_documents(client, texts):
+                return None
             st.success("✅ Documents stored successfully!")
             return vector_store
             
@@ -213,6 +364,28 @@ def create_vector_store(client: QdrantClient, texts: List) -> Optional[QdrantVec
         st.error(f"🔴 Vector store error: {str(e)}")
         return None
 
+def _points_to_documents(points) -> List[Document]:
+    """Rebuild LangChain documents from points stored by upload_documents."""
+    return [
+        Document(
+            page_content=point.payload.get("page_content", ""),
+            metadata=point.payload.get("metadata", {})
+        )
+        for point in points
+    ]
+
+def retrieve(client: QdrantClient, query_embedding: List[float], k: int = 5, threshold: float = 0.7, ef: int = HNSW_EF) -> List[Document]:
+    """Search the collection directly, tuning HNSW ef per query."""
+    points = client.query_points(
+        collection_name=COLLECTION_NAME,
+        query=query_embedding,
+        limit=k,
+        score_threshold=threshold,
+        search_params=get_search_params(hnsw_ef=ef),
+        with_payload=True
+    ).points
+    return _points_to_documents(points)
+
 def check_document_relevance(query: str, vector_store, threshold: float = 0.7) -> tuple[bool, List]:
     """Check if documents in vector store are relevant to the query."""
     if not vector_store:
@@ -220,7 +393,69 @@ def check_document_relevance(query: str, vector_store, threshold: float = 0.7) -
         
     retriever = vector_store.as_retriever(
         search_type="similarity_score_threshold",
-        search_kwargs={"k": 5, "score_threshold": threshold}
+        search_kwargs={"k": 5, "score_threshold": threshold, "search_params": get_search_params()}
     )
     docs = retriever.invoke(query)
     return bool(docs), docs
+
+def _search_mode_filter(use_web_search: bool) -> models.Filter:
+    """Match cache entries answered with the same web search setting."""
+    return models.Filter(must=[
+        models.FieldCondition(key="use_web_search", match=models.MatchValue(value=use_web_search))
+    ])
+
+def get_cached_response(client: QdrantClient, query_embedding: List[float], use_web_search: bool) -> Optional[Tuple[str, List[Document]]]:
+    """Return a cached answer and its sources for a semantically equivalent query."""
+    try:
+        if not client.collection_exists(RESPONSE_CACHE_COLLECTION):
+            return None
+        hits = client.query_points(
+            collection_name=RESPONSE_CACHE_COLLECTION,
+            query=query_embedding,
+            query_filter=_search_mode_filter(use_web_search),
+            limit=1,
+            score_threshold=SEMANTIC_CACHE_THRESHOLD,
+            with_payload=True
+        ).points
+        if not hits:
+            return None
+        payload = hits[0].payload
+        docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload.get("sources", [])]
+        return payload["answer"], docs
+    except Exception as e:
+        st.warning(f"⚠️ Semantic cache lookup failed: {str(e)}")
+        return None
+
+def cache_response(client: QdrantClient, query_embedding: List[float], answer: str, docs: List[Document], use_web_search: bool) -> None:
+    """Store an answer and its sources keyed by the query embedding and search mode."""
+    try:
+        if not client.collection_exists(RESPONSE_CACHE_COLLECTION):
+            client.create_collection(
+                collection_name=RESPONSE_CACHE_COLLECTION,
+                vectors_config=VectorParams(
+                    size=VECTOR_SIZE,
+                    distance=Distance.COSINE
+                )
+            )
+        client.upsert(
+            collection_name=RESPONSE_CACHE_COLLECTION,
+            points=[PointStruct(
+                id=str(uuid.uuid4()),
+                vector=query_embedding,
+                payload={
+                    "answer": answer,
+                    "sources": [{"page_content": d.page_content, "metadata": d.metadata} for d in docs],
+                    "use_web_search": use_web_search
+                }
+            )]
+        )
+    except Exception as e:
+        st.warning(f"⚠️ Could not cache response: {str(e)}")
+
+def clear_response_cache(client: QdrantClient) -> None:
+    """Drop all cached answers, e.g. after the indexed documents change."""
+    try:
+        if client.collection_exists(RESPONSE_CACHE_COLLECTION):
+            client.delete_collection(RESPONSE_CACHE_COLLECTION)
+    except Exception as e:
+        st.warning(f"⚠️ Could not clear response cache: {str(e)}")
@@ -1,44 +1,108 @@
+from copy import copy
+from typing import Final
+
 import streamlit as st
 
+# UI strings shared across reruns
+_ICON_PDF: Final = "📄"
+_ICON_WEB: Final = "🌐"
+_HEADER_API: Final = "🔑 API Configuration"
+_HEADER_VECTOR_DB: Final = "Vector Database"
+_HEADER_WEB_SEARCH: Final = f"{_ICON_WEB} Web Search Configuration"
+_HEADER_SEARCH: Final = "🎯 Search Configuration"
+_HEADER_PROCESSED_SOURCES: Final = "📚 Processed Sources"
+_LABEL_GOOGLE_KEY: Final = "Google API Key"
+_LABEL_STORAGE_MODE: Final = "Storage Mode"
+_LABEL_QDRANT_KEY: Final = "Qdrant API Key"
+_LABEL_QDRANT_URL: Final = "Qdrant URL"
+_LABEL_CLEAR_HISTORY: Final = "🗑️ Clear Chat History"
+_LABEL_RESET_DB: Final = "🔄 Reset Database Connection"
+_LABEL_USE_WEB: Final = "Enable Web Search Fallback"
+_LABEL_EXA_KEY: Final = "Exa AI API Key"
+_LABEL_DOMAINS: Final = "Custom domains (comma-separated)"
+_LABEL_THRESH: Final = "Document Similarity Threshold"
+_LABEL_SEMANTIC_CACHE: Final = "Enable Semantic Cache"
+_LABEL_FORCE_WEB: Final = f"{_ICON_WEB} Force web search"
+_LABEL_EARLIER: Final = "⬆️ Show earlier messages ({hidden} hidden)"
+_LABEL_SOURCES: Final = "🔍 See document sources"
+_SUCCESS_RESET_DB: Final = "✅ Database connection reset!"
+_PLACEHOLDER_CHAT: Final = "Ask about your documents..."
+_PLACEHOLDER_QDRANT_URL: Final = "https://your-cluster.cloud.qdrant.io:6333"
+_INFO_LOCAL_STORAGE: Final = "📂 Data will be stored in ./qdrant_data"
+_HELP_STORAGE_MODE: Final = "Local: Store data in local folder. Cloud: Connect to Qdrant Cloud."
+_HELP_EXA_KEY: Final = "Required for web search fallback when no relevant documents are found"
+_HELP_DOMAINS: Final = "Enter domains to search from, e.g.: arxiv.org,wikipedia.org"
+_HELP_THRESH: Final = "Lower values will return more documents but might be less relevant. Higher values are more strict."
+_HELP_SEMANTIC_CACHE: Final = "Reuse answers for questions similar to ones already answered"
+
+_HISTORY_PAGE_SIZE = 20
+
+# Built once at import; mutable defaults are copied per session in init_session_state
+_DEFAULTS = (
+    ('google_api_key', ""),
+    ('qdrant_api_key', ""),
+    ('qdrant_url', ""),
+    ('qdrant_storage_mode', "Local"),  # Default to Local for easier setup
+    ('vector_store', None),
+    ('processed_documents', []),
+    ('documents_loaded', False),  # Track if we've loaded documents from DB
+    ('history', []),
+    ('exa_api_key', ""),
+    ('use_web_search', False),
+    ('force_web_search', False),
+    ('similarity_threshold', 0.7),
+    ('enable_semantic_cache', False),
+    ('history_window', _HISTORY_PAGE_SIZE),  # Number of recent messages rendered
+)
+_DEFAULT_KEYS = frozenset(key for key, _ in _DEFAULTS)
+
 def init_session_state():
     """Initialize session state variables."""
-    defaults = {
-        'google_api_key': "",
-        'qdrant_api_key': "",
-        'qdrant_url': "",
-        'qdrant_storage_mode': "Local",  # Default to Local for easier setup
-        'vector_store': None,
-        'processed_documents': [],
-        'documents_loaded': False,  # Track if we've loaded documents from DB
-        'history': [],
-        'exa_api_key': "",
-        'use_web_search': False,
-        'force_web_search': False,
-        'similarity_threshold': 0.7
-    }
+    state = st.session_state
+    missing = _DEFAULT_KEYS.difference(state.keys())
+    if not missing:
+        # Already initialized, the common case on every rerun
+        return
     
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    for key, value in _DEFAULTS:
+        if key in missing:
+            state[key] = copy(value)
+
+_DEFAULT_DOMAINS = ("arxiv.org", "wikipedia.org", "github.com", "medium.com")
+_DEFAULT_DOMAINS_JOINED = ",".join(_DEFAULT_DOMAINS)
+
+@st.cache_data(max_entries=16)
+def _parse_domains(raw: str) -> tuple[str, ...]:
+    """Split a comma-separated domain list, dropping blanks."""
+    return tuple(d for d in (x.strip() for x in raw.split(",")) if d)
+
+def _clear_history():
+    # Clear in place so other references to the list stay valid
+    st.session_state.history.clear()
+    st.session_state.history_window = _HISTORY_PAGE_SIZE
+
+def _reset_database():
+    # Runs before the rerun, so no early st.rerun() skips the keyed widgets below
+    st.cache_resource.clear()
+    st.session_state.vector_store = None
+    st.session_state.processed_documents = []
+    st.session_state.documents_loaded = False
+    st.success(_SUCCESS_RESET_DB)
 
 def render_sidebar():
     """Render the sidebar configuration."""
-    st.sidebar.header("🔑 API Configuration")
+    st.sidebar.header(_HEADER_API)
     
-    st.session_state.google_api_key = st.sidebar.text_input(
-        "Google API Key", 
-        type="password", 
-        value=st.session_state.google_api_key
-    )
+    st.sidebar.text_input(_LABEL_GOOGLE_KEY, type="password", key="google_api_key")
 
-    st.sidebar.subheader("Vector Database")
+    st.sidebar.subheader(_HEADER_VECTOR_DB)
     
     # Check if storage mode changed and reset client if needed
     current_mode = st.sidebar.radio(
-        "Storage Mode",
+        _LABEL_STORAGE_MODE,
         ["Local", "Cloud"],
         index=0 if st.session_state.get('qdrant_storage_mode', 'Local') == 'Local' else 1,
-        help="Local: Store data in local folder. Cloud: Connect to Qdrant Cloud."
+        help=_HELP_STORAGE_MODE
     )
     
     if 'qdrant_storage_mode' in st.session_state and current_mode != st.session_state.qdrant_storage_mode:
@@ -50,91 +114,120 @@ def render_sidebar():
     
     st.session_state.qdrant_storage_mode = current_mode
 
+    # Inputs that are only rendered conditionally keep the value= round trip:
+    # Streamlit deletes a keyed widget's state on runs where it isn't rendered,
+    # which would drop these credentials whenever the section is hidden
     if st.session_state.qdrant_storage_mode == "Cloud":
         st.session_state.qdrant_api_key = st.sidebar.text_input(
-            "Qdrant API Key", 
+            _LABEL_QDRANT_KEY, 
             type="password", 
             value=st.session_state.qdrant_api_key
         )
         st.session_state.qdrant_url = st.sidebar.text_input(
-            "Qdrant URL",
-            placeholder="https://your-cluster.cloud.qdrant.io:6333",
+            _LABEL_QDRANT_URL,
+            placeholder=_PLACEHOLDER_QDRANT_URL,
             value=st.session_state.qdrant_url
         )
     else:
-        st.sidebar.info(f"📂 Data will be stored in ./qdrant_data")
+        st.sidebar.info(_INFO_LOCAL_STORAGE)
 
-    if st.sidebar.button("🗑️ Clear Chat History"):
-
-        st.session_state.history = []
-        st.rerun()
+    st.sidebar.button(_LABEL_CLEAR_HISTORY, on_click=_clear_history)
     
-    if st.sidebar.button("🔄 Reset Database Connection"):
-        st.cache_resource.clear()
-        st.session_state.vector_store = None
-        st.session_state.processed_documents = []
-        st.session_state.documents_loaded = False
-        st.success("✅ Database connection reset!")
-        st.rerun()
+    st.sidebar.button(_LABEL_RESET_DB, on_click=_reset_database)
 
-    st.sidebar.header("🌐 Web Search Configuration")
-    st.session_state.use_web_search = st.sidebar.checkbox(
-        "Enable Web Search Fallback", 
-        value=st.session_state.use_web_search
-    )
+    st.sidebar.header(_HEADER_WEB_SEARCH)
+    st.sidebar.checkbox(_LABEL_USE_WEB, key="use_web_search")
 
-    search_domains = []
+    search_domains = ()
     if st.session_state.use_web_search:
         st.session_state.exa_api_key = st.sidebar.text_input(
-            "Exa AI API Key",
+            _LABEL_EXA_KEY,
             type="password",
             value=st.session_state.exa_api_key,
-            help="Required for web search fallback when no relevant documents are found"
+            help=_HELP_EXA_KEY
         )
         
-        default_domains = ["arxiv.org", "wikipedia.org", "github.com", "medium.com"]
         custom_domains = st.sidebar.text_input(
-            "Custom domains (comma-separated)",
-            value=",".join(default_domains),
-            help="Enter domains to search from, e.g.: arxiv.org,wikipedia.org"
+            _LABEL_DOMAINS,
+            value=_DEFAULT_DOMAINS_JOINED,
+            help=_HELP_DOMAINS
         )
-        search_domains = [d.strip() for d in custom_domains.split(",") if d.strip()]
+        search_domains = _parse_domains(custom_domains)
 
-    st.sidebar.header("🎯 Search Configuration")
-    st.session_state.similarity_threshold = st.sidebar.slider(
-        "Document Similarity Threshold",
+    st.sidebar.header(_HEADER_SEARCH)
+    st.sidebar.slider(
+        _LABEL_THRESH,
         min_value=0.0,
         max_value=1.0,
-        value=st.session_state.similarity_threshold,
-        help="Lower values will return more documents but might be less relevant. Higher values are more strict."
+        key="similarity_threshold",
+        help=_HELP_THRESH
     )
+    st.sidebar.checkbox(
+        _LABEL_SEMANTIC_CACHE,
+        key="enable_semantic_cache",
+        help=_HELP_SEMANTIC_CACHE
+    )
+    st.sidebar.toggle(_LABEL_FORCE_WEB, key="force_web_search")
     
     return search_domains
 
 def render_chat_interface():
-    """Render the chat input and toggle."""
-    chat_col, toggle_col = st.columns([0.9, 0.1])
-    
-    with chat_col:
-        prompt = st.chat_input("Ask about your documents...")
-        
-    with toggle_col:
-        st.session_state.force_web_search = st.toggle('🌐', help="Force web search")
-        
-    return prompt
+    """Render the chat input."""
+    return st.chat_input(_PLACEHOLDER_CHAT)
+
+def _show_earlier_messages():
+    st.session_state.history_window += _HISTORY_PAGE_SIZE
 
 def display_chat_history():
-    """Display the chat history."""
-    for message in st.session_state.history:
+    """Display the most recent chat messages, loading older ones on demand."""
+    # Streamlit drops elements that aren't re-emitted, so every rerun renders
+    # the visible window; keeping it bounded keeps reruns O(window), not O(history).
+    # Not a fragment: a fragment-only rerun would redraw the latest turn that
+    # handle_prompt wrote outside it, showing that turn twice
+    history = st.session_state.history
+    start = max(0, len(history) - st.session_state.history_window)
+    if start:
+        st.button(_LABEL_EARLIER.format(hidden=start), on_click=_show_earlier_messages)
+    
+    for message in history[start:]:
         with st.chat_message(message["role"]):
             st.write(message["content"])
 
+def display_processed_sources():
+    """List the indexed sources in the sidebar."""
+    if not st.session_state.processed_documents:
+        return
+    st.sidebar.header(_HEADER_PROCESSED_SOURCES)
+    for source in st.session_state.processed_documents:
+        icon = _ICON_PDF if source.endswith('.pdf') else _ICON_WEB
+        st.sidebar.text(f"{icon} {source}")
+
+# Per source type lookups for display_sources; anything else is treated as a URL
+_ICON = {"pdf": _ICON_PDF}
+_NAME_KEY = {"pdf": "file_name"}
+_SRC_TMPL = "{icon} **Source {i}** from `{name}`:\n\n{snippet}..."
+
+def _source_rows(docs) -> list[tuple[str, str, str]]:
+    """Precompute (icon, name, snippet) for each source document."""
+    rows = []
+    for doc in docs:
+        metadata = doc.metadata
+        source_type = metadata.get("source_type", "unknown")
+        rows.append((
+            _ICON.get(source_type, _ICON_WEB),
+            metadata.get(_NAME_KEY.get(source_type, "url"), "unknown"),
+            doc.page_content[:200]
+        ))
+    return rows
+
+@st.fragment
 def display_sources(docs):
-    """Display document sources in an expander."""
-    with st.expander("🔍 See document sources"):
-        for i, doc in enumerate(docs, 1):
-            source_type = doc.metadata.get("source_type", "unknown")
-            source_icon = "📄" if source_type == "pdf" else "🌐"
-            source_name = doc.metadata.get("file_name" if source_type == "pdf" else "url", "unknown")
-            st.write(f"{source_icon} Source {i} from {source_name}:")
-            st.write(f"{doc.page_content[:200]}...")
+    """Display document sources, building them only once the user opens them."""
+    # st.expander always renders its body, so a toggle gates the work instead;
+    # as a fragment, flipping it reruns only this block
+    if st.toggle(_LABEL_SOURCES, key=f"sources_open_{id(docs)}"):
+        # One markdown element for all sources instead of one per source
+        st.markdown("\n\n---\n\n".join(
+            _SRC_TMPL.format_map({"icon": icon, "i": i, "name": name, "snippet": snippet})
+            for i, (icon, name, snippet) in enumerate(_source_rows(docs), 1)
+        ))